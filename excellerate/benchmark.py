@@ -0,0 +1,284 @@
+from nmigen import *
+from nmigen.back import rtlil
+from dataclasses import dataclass, asdict
+from typing import Optional
+import argparse
+import json
+import multiprocessing
+import queue as queues
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import traceback
+import tracemalloc
+import warnings
+
+from compiler import Spreadsheet
+from generate import SHAPES, generate
+from simulation import Harness
+import parser
+
+@dataclass
+class Measurement:
+    shape: str
+    size: int
+    evaluation: str
+    cells: int
+    parse_time: float
+    elaborate_time: float
+    peak_memory: int
+    rss_per_10k_cells: Optional[int]
+    cycles_per_second: Optional[float] = None
+    simulate_time: Optional[float] = None
+    noise: Optional[float] = None
+    yosys_cells: Optional[int] = None
+    output_changes_per_cycle: Optional[float] = None
+    output_toggles_per_cycle: Optional[float] = None
+    loads_per_cycle: Optional[float] = None
+
+# lower is better for all metrics except these
+HIGHER_IS_BETTER = {"cycles_per_second"}
+# timed metrics and the duration they were measured over
+DURATIONS = {
+    "parse_time": "parse_time",
+    "elaborate_time": "elaborate_time",
+    "cycles_per_second": "simulate_time",
+}
+# timings are the median of this many runs
+REPEAT = 5
+# shorter durations are mostly noise and not compared
+MIN_TIME = 0.01
+# on smaller sheets the RSS growth is dominated by the interpreter
+MIN_RSS_CELLS = 1000
+
+def _parse(wb):
+    for sheet in wb.sheetnames:
+        for row in wb[sheet]:
+            for cell in row:
+                parser.parse(str(cell.value))
+
+def parse_time(wb, repeat=REPEAT):
+    """Times of ``repeat`` runs parsing every cell."""
+    return timeit.repeat(lambda: _parse(wb), number=1, repeat=repeat)
+
+def elaborate_time(wb, evaluation="always", repeat=REPEAT):
+    """Times of ``repeat`` runs elaborating the whole design, parsing included."""
+    sprs = [Spreadsheet(wb, evaluation=evaluation) for _ in range(repeat)]
+    fresh = iter(sprs)
+    times = timeit.repeat(lambda: Fragment.get(next(fresh), None), number=1, repeat=repeat)
+    return times, len(sprs[0].cells)
+
+def _spread(times):
+    """Spread of repeated timings relative to their median."""
+    return (max(times) - min(times))/statistics.median(times)
+
+def peak_memory(wb, evaluation="always"):
+    """Peak Python heap while building and elaborating the design."""
+    tracemalloc.start()
+    spr = Spreadsheet(wb, evaluation=evaluation)
+    Fragment.get(spr, None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes."""
+    # ru_maxrss survives exec on Linux, so a fresh process would report
+    # the peak of its parent; VmHWM belongs to the current address space
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])*1024
+    except FileNotFoundError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak*1024
+
+def _rss_worker(shape, size, evaluation, queue):
+    try:
+        wb, _, _ = generate(shape, size)
+        before = _peak_rss()
+        spr = Spreadsheet(wb, evaluation=evaluation)
+        Fragment.get(spr, None)
+        queue.put((_peak_rss()-before, len(spr.cells)))
+    except BaseException:
+        queue.put(traceback.format_exc())
+
+def rss_per_10k_cells(shape, size, evaluation="always", timeout=600):
+    """Growth of peak RSS in bytes per 10k cells, measured in a fresh process."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_rss_worker, args=(shape, size, evaluation, queue))
+    process.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                result = queue.get(timeout=1)
+                break
+            except queues.Empty:
+                # a worker that died without a result would be waited on forever
+                if not process.is_alive():
+                    raise RuntimeError(f"RSS worker exited with code {process.exitcode}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"RSS worker took longer than {timeout}s")
+    finally:
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+    if isinstance(result, str):
+        raise RuntimeError(f"RSS worker failed:\n{result}")
+    growth, cells = result
+    return growth*10000//max(cells, 1)
+
+def simulate(wb, inputs, outputs, evaluation="always", count_activity=False,
+             vectors=4, max_cycles=200):
+    harness = Harness(wb, inputs, outputs, evaluation=evaluation)
+    return harness.run([{name: i for name in inputs} for i in range(1, vectors+1)],
+                       max_cycles=max_cycles, count_activity=count_activity)
+
+def _yosys():
+    """A function running yosys, from nMigen's toolchain or else from PATH."""
+    try:
+        from nmigen._toolchain.yosys import find_yosys, YosysError
+    except ImportError:
+        pass
+    else:
+        try:
+            return find_yosys(lambda ver: ver >= (0, 9)).run
+        except YosysError:
+            pass
+    path = shutil.which("yosys")
+    if path is None:
+        return None
+    def run(args, stdin=""):
+        return subprocess.run([path, *args], input=stdin, capture_output=True,
+                              text=True, check=True).stdout
+    return run
+
+def yosys_cells(wb, evaluation="always"):
+    """Number of cells after a generic yosys synthesis, None without yosys."""
+    yosys = _yosys()
+    if yosys is None:
+        warnings.warn("yosys not found, skipping cell counts")
+        return None
+    spr = Spreadsheet(wb, evaluation=evaluation)
+    fragment = Fragment.get(spr, None)
+    ports = [s for cell in spr.cells.values() for s in (cell.value.signal, cell.ready)]
+    text = rtlil.convert(fragment, ports=ports)
+    output = yosys(["-"], f"read_ilang <<rtlil\n{text}\nrtlil\nsynth -flatten\nstat\n")
+    counts = re.findall(r"Number of cells:\s+(\d+)", output)
+    return int(counts[-1]) if counts else None
+
+def measure(shape, size, evaluation="always", sim=True, synth=True, repeat=REPEAT):
+    wb, inputs, outputs = generate(shape, size)
+    parse = parse_time(wb, repeat)
+    elaborate, cells = elaborate_time(wb, evaluation, repeat)
+    timings = [parse, elaborate]
+    m = Measurement(
+        shape=shape,
+        size=size,
+        evaluation=evaluation,
+        cells=cells,
+        parse_time=statistics.median(parse),
+        elaborate_time=statistics.median(elaborate),
+        peak_memory=peak_memory(wb, evaluation),
+        rss_per_10k_cells=(rss_per_10k_cells(shape, size, evaluation)
+                           if cells >= MIN_RSS_CELLS else None),
+        yosys_cells=yosys_cells(wb, evaluation) if synth else None,
+    )
+    if sim:
+        runs = [simulate(wb, inputs, outputs, evaluation) for _ in range(repeat)]
+        elapsed = [res.elapsed for res in runs]
+        m.simulate_time = statistics.median(elapsed)
+        m.cycles_per_second = runs[0].cycles/m.simulate_time
+        timings.append(elapsed)
+        # separate run, reading every cell each cycle skews cycles per second
+        res = simulate(wb, inputs, outputs, evaluation, count_activity=True)
+        m.output_changes_per_cycle = res.output_changes_per_cycle
+        m.output_toggles_per_cycle = res.output_toggles_per_cycle
+        m.loads_per_cycle = res.loads_per_cycle
+    m.noise = max(_spread(times) for times in timings)
+    return m
+
+def compare(previous, current, threshold, min_time=MIN_TIME):
+    """Print metrics that got worse by more than ``threshold`` (a fraction).
+
+    For timings the noise of either run, the spread of its repeats, is
+    added to ``threshold``. Timings measured over less than ``min_time``
+    seconds in either run are skipped, as their differences are mostly noise.
+    """
+    def key(m):
+        return m["shape"], m["size"], m.get("evaluation", "always")
+    old = {key(m): m for m in previous["results"]}
+    regressions = 0
+    for m in current["results"]:
+        base = old.get(key(m))
+        if base is None:
+            continue
+        for metric, value in m.items():
+            if (metric in ("shape", "size", "evaluation", "cells", "simulate_time", "noise")
+                    or value is None or not base.get(metric)):
+                continue
+            limit = threshold
+            duration = DURATIONS.get(metric)
+            if duration:
+                if min(m.get(duration) or 0, base.get(duration) or 0) < min_time:
+                    continue
+                limit += max(m.get("noise") or 0, base.get("noise") or 0)
+            change = (value - base[metric])/base[metric]
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > limit:
+                regressions += 1
+                print(f"REGRESSION {m['shape']}/{m['size']}/{m['evaluation']} {metric}: "
+                      f"{base[metric]:.4g} -> {value:.4g} ({change:+.0%}) "
+                      f"vs {previous['label']}")
+    return regressions
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="Benchmark excellerate on generated workbooks")
+    argparser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=list(SHAPES))
+    argparser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    argparser.add_argument("--evaluation", nargs="+", default=["always", "activity"],
+                           choices=["always", "activity"])
+    argparser.add_argument("--label", default=time.strftime("%Y-%m-%d %H:%M:%S"),
+                           help="name of this run, e.g. a version or commit")
+    argparser.add_argument("--results", default="benchmarks.json",
+                           help="file the runs are appended to")
+    argparser.add_argument("--threshold", type=float, default=0.1,
+                           help="relative slowdown reported as a regression")
+    argparser.add_argument("--min-time", type=float, default=MIN_TIME,
+                           help="shortest timing in seconds that is compared")
+    argparser.add_argument("--repeat", type=int, default=REPEAT,
+                           help="runs per timing, the median is kept")
+    argparser.add_argument("--no-sim", dest="sim", action="store_false")
+    argparser.add_argument("--no-synth", dest="synth", action="store_false")
+    args = argparser.parse_args()
+
+    run = {"label": args.label, "results": []}
+    for shape in args.shapes:
+        for size in args.sizes:
+            for evaluation in args.evaluation:
+                m = measure(shape, size, evaluation, sim=args.sim, synth=args.synth,
+                            repeat=args.repeat)
+                print(m)
+                run["results"].append(asdict(m))
+
+    try:
+        with open(args.results) as f:
+            history = json.load(f)
+    except FileNotFoundError:
+        history = []
+    regressions = compare(history[-1], run, args.threshold, args.min_time) if history else 0
+    history.append(run)
+    with open(args.results, "w") as f:
+        json.dump(history, f, indent=1)
+    sys.exit(1 if regressions else 0)
@@ -1,11 +1,12 @@
 from nmigen import *
 from nmigen.sim.pysim import *
 from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
 from collections import defaultdict
 
 from fixedpoint import Q, QArray
 import parser
-from functions import Location, Cell, Sum
+from functions import Location, Cell, Sum, Iteration
 
 class CellDict(defaultdict):
     def __init__(self, nint, nfrac, signed):
@@ -26,30 +27,128 @@ class CellDict(defaultdict):
 
 class Spreadsheet(Elaboratable):
 
-    def __init__(self, workbook, nint=16, nfrac=16, signed=True):
+    def __init__(self, workbook, nint=16, nfrac=16, signed=True, inputs=(),
+                 circular=(), max_iterations=None, tolerance=None,
+                 evaluation="always", sheet_enable=False):
         self.nint = nint
         self.nfrac = nfrac
         self.signed = signed
         self.workbook = workbook
+        # cells driven from outside (e.g. a testbench) instead of their formula
+        self.inputs = set(inputs)
+        # groups of circularly referencing cells, iterated like Excel's
+        # iterative calculation, with its settings unless given here
+        self.circular = [list(group) for group in circular]
+        self.groups = {loc: i for i, group in enumerate(self.circular) for loc in group}
+        calc = workbook.calculation
+        if max_iterations is None:
+            max_iterations = calc.iterateCount or 100
+        if max_iterations < 1:
+            raise ValueError(f"max_iterations must be at least 1, not {max_iterations}")
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance if tolerance is not None else (calc.iterateDelta or 0.001)
+        # "always" loads every cell register on every clock, "activity" only
+        # when one of its inputs asserted ready
+        if evaluation not in ("always", "activity"):
+            raise ValueError(f"evaluation {evaluation} not one of always, activity")
+        self.evaluation = evaluation
+        # constants are ready once, after reset
+        self.start = Signal(reset=1)
+        # high while a SUM or circular group has not finished
+        self.busy = Signal()
+        # a per sheet enable pauses the formula cells of that sheet, not its
+        # input cells or circular groups
+        self.enable = {}
+        if sheet_enable:
+            if evaluation != "activity":
+                raise ValueError("sheet_enable requires activity evaluation")
+            self.enable = {sheet: Signal(reset=1, name=f"{sheet}_enable")
+                           for sheet in workbook.sheetnames}
+        self.driven = []
+        self.dirty = []
         self.submodules = []
 
         self.cells = CellDict(nint, nfrac, signed)
 
     def elaborate(self, platform):
         m = Module()
+        wb = self.workbook
+        results = {}
+        # elaborating again (e.g. for another simulation) starts afresh
+        self.driven = []
+        self.dirty = []
+        self.submodules = []
+        m.d.sync += self.start.eq(0)
+        for loc in self.inputs:
+            self.cells[loc]
         for sheet in wb.sheetnames:
             for row in wb[sheet]:
                 for cell in row:
+                    if cell.value is None:
+                        continue
                     loc = Location(sheet, cell.column, cell.row)
+                    if loc in self.inputs:
+                        continue
                     ast = parser.parse(str(cell.value))
+                    submodules = len(self.submodules)
                     sig = self.compile_cell(loc, ast)
-                    if sig is not None:
-                        cell = self.cells[Location(sheet, cell.column, cell.row)]
+                    if sig is None:
+                        continue
+                    if loc in self.groups:
+                        # a group takes a new value every clock, it would
+                        # iterate on the stale result of a multi-cycle SUM
+                        if len(self.submodules) > submodules:
+                            raise ValueError(f"{sheet}!{cell.coordinate} is in a circular "
+                                             "group and can't use SUM")
+                        results[loc] = sig
+                        continue
+                    cell = self.cells[loc]
+                    self.driven.append(loc)
+                    if self.evaluation == "activity":
+                        self.update_on_activity(m, loc, cell, sig)
+                    else:
                         m.d.sync += cell.value.eq(sig.value)
                         m.d.sync += cell.ready.eq(sig.ready)
+        for group in self.circular:
+            group = [loc for loc in group if loc in results]
+            self.submodules.append(Iteration(
+                [self.cells[loc] for loc in group],
+                [results[loc] for loc in group],
+                self.max_iterations, self.tolerance, self.start))
         m.submodules += self.submodules
+        m.d.comb += self.busy.eq(Cat(sub.busy for sub in self.submodules).any())
         return m
 
+    def update_on_activity(self, m, loc, cell, sig):
+        """Only load ``cell`` when one of its inputs changed."""
+        enable = self.enable.get(loc.sheet)
+        if enable is None:
+            with m.If(sig.ready):
+                m.d.sync += cell.value.eq(sig.value)
+            m.d.sync += cell.ready.eq(sig.ready)
+            return
+        # remember changes that arrive while the sheet is disabled
+        dirty = Signal(name=f"{loc.sheet}_{loc.col}_{loc.row}_dirty")
+        self.dirty.append(dirty)
+        pending = sig.ready | dirty
+        with m.If(enable):
+            with m.If(pending):
+                m.d.sync += cell.value.eq(sig.value)
+            m.d.sync += cell.ready.eq(pending)
+            m.d.sync += dirty.eq(0)
+        with m.Else():
+            m.d.sync += cell.ready.eq(0)
+            m.d.sync += dirty.eq(pending)
+
+    def reference(self, cell, loc):
+        """The cell at ``loc`` as seen from the formula in ``cell``."""
+        ref = self.cells[loc]
+        group = self.groups.get(loc)
+        if group is not None and group == self.groups.get(cell):
+            # feedback within a circular group must not restart its iteration
+            return Cell(ref.value, Const(0))
+        return ref
+
     def compile_cell(self, cell, ast):
         if ast is None:
             return None
@@ -86,7 +185,7 @@ class Spreadsheet(Elaboratable):
         elif isinstance(ast, float):
             return Cell(
                 Q.from_float(ast, self.nint, self.nfrac, self.signed),
-                Const(0)
+                self.start
             )
         elif isinstance(ast, parser.Array):
             return Cell(
@@ -95,22 +194,19 @@ class Spreadsheet(Elaboratable):
                         Q.from_float(i, self.nint, self.nfrac, self.signed)
                         for i in row])
                     for row in ast.elements]),
-                Const(0)
+                self.start
             )
         elif isinstance(ast, parser.Range):
             sheet = ast.sheet or cell.sheet
             min_col, min_row, max_col, max_row = ast.boundaries
             if min_col==max_col and min_row==max_row:
-                return self.cells[Location(sheet, min_col, min_row)]
+                return self.reference(cell, Location(sheet, min_col, min_row))
+            refs = [[self.reference(cell, Location(sheet, col, row))
+                     for col in range(min_col, max_col+1)]
+                    for row in range(min_row, max_row+1)]
             return Cell(
-                QArray([
-                    QArray([
-                        self.cells[Location(sheet, col, row)].value
-                        for col in range(min_col, max_col+1)])
-                    for row in range(min_row, max_row+1)]),
-                Cat(self.cells[Location(sheet, col, row)].ready
-                    for col in range(min_col, max_col+1)
-                    for row in range(min_row, max_row+1)).any()
+                QArray([QArray([ref.value for ref in row]) for row in refs]),
+                Cat(ref.ready for row in refs for ref in row).any()
             )
         elif isinstance(ast, parser.Function):
             if ast.name == "SUM":
@@ -118,22 +214,40 @@ class Spreadsheet(Elaboratable):
                 summer = Sum(*args)
                 self.submodules.append(summer)
                 return summer.result
+            elif ast.name == "INDEX":
+                args = [self.compile_cell(cell, arg) for arg in ast.args]
+                table = args[0].value
+                if not isinstance(table, QArray) or len(args) not in (2, 3):
+                    name = f"{cell.sheet}!{get_column_letter(cell.col)}{cell.row}"
+                    raise TypeError(f"INDEX in {name} needs a range of several cells "
+                                    "and one or two indices")
+                # rows and columns are counted from 1
+                index = [arg.value.signal[arg.value.nfrac:] - 1 for arg in args[1:]]
+                if len(index) == 1 and len(table) == 1:
+                    # a single index into a row picks the column
+                    value = table[0][index[0]]
+                else:
+                    row = table[index[0]]
+                    value = row[index[1]] if len(index) > 1 else row[0]
+                return Cell(value, Cat(arg.ready for arg in args).any())
+            else:
+                raise NameError(f"function {ast.name} not handled")
         else:
             raise TypeError(f"{ast} is not of a supported type")
 
 if __name__ == '__main__':
+    import sys
+    from openpyxl.utils import quote_sheetname
+    from simulation import Harness
     wb = load_workbook('simple.xlsx')
-    spr = Spreadsheet(wb)
-    sim = Simulator(spr)
-    def testbench():
-        for i in range(50):
-            yield Tick()
-            print("###### TICK ######")
-            for loc, cell in spr.cells.items():
-                res = yield cell.value.signal
-                print(loc, cell.value.to_float(res))
-
-    sim.add_clock(1e-6)
-    sim.add_process(testbench)
-    with sim.write_vcd("test.vcd", "test.gtkw", traces=[c.value.signal for c in spr.cells.values()]):
-        sim.run()
+    # python compiler.py [outputs...], e.g. Sheet1!B2
+    outputs = sys.argv[1:] or [f"{quote_sheetname(sheet)}!{cell.coordinate}"
+                               for sheet in wb.sheetnames
+                               for row in wb[sheet]
+                               for cell in row
+                               if cell.data_type == 'f']
+    harness = Harness(wb, [], outputs)
+    res = harness.run([{}], vcd_file="test.vcd", window=(0, 50))
+    for name, value in res.samples[0].items():
+        print(name, value)
+    print(f"{res.cycles} cycles, {res.cycles_per_second:.0f} cycles/s ({res.backend})")
@@ -1,7 +1,7 @@
 from nmigen import *
 from nmigen.sim.pysim import *
 import math
-from functools import wraps
+from functools import wraps, lru_cache
 from collections.abc import MutableSequence
 
 def operator(logical=False):
@@ -20,6 +20,8 @@ def operator(logical=False):
     return decorator
 
 class Q:
+    __slots__ = ("signal", "nint", "nfrac", "_casts")
+
     def __init__(self, nint, nfrac, signed=False, signal=None, **kwargs):
         if signal is not None:
             self.signal = signal
@@ -29,8 +31,11 @@ class Q:
 
         self.nint = nint
         self.nfrac = nfrac
+        self._casts = None
 
+    # constants are immutable, so identical ones can be shared
     @classmethod
+    @lru_cache(maxsize=4096)
     def from_float(cls, value, nint, nfrac, signed=False):
         integer = int(math.floor(value*(1<<nfrac)))
         shape = Shape(nint+nfrac, signed)
@@ -44,6 +49,11 @@ class Q:
         #comment out to break abs()
         if nint==self.nint and nfrac==self.nfrac:
             return self
+        # the same cell value gets widened for every formula that uses it
+        if self._casts is None:
+            self._casts = {}
+        elif (nint, nfrac) in self._casts:
+            return self._casts[nint, nfrac]
 
         start = self.nfrac-nfrac
         end = self.nfrac+nint
@@ -57,7 +67,9 @@ class Q:
         sig = Cat(pad_start, sig, pad_end)
         if self.signed:
             sig = sig.as_signed()
-        return Q(nint, nfrac, signal=sig) 
+        res = Q(nint, nfrac, signal=sig)
+        self._casts[nint, nfrac] = res
+        return res
 
     def like(self):
         return Q(self.nint, self.nfrac, self.signed)
@@ -1,19 +1,22 @@
 from nmigen import *
 from nmigen.sim.pysim import *
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 
 from fixedpoint import Q, QArray
 
+# one of each is created per spreadsheet cell, so keep them free of __dict__
 @dataclass(frozen=True)
 class Location:
+    __slots__ = ("sheet", "col", "row")
     sheet: str
     col: int
     row: int
 
 @dataclass(frozen=True)
 class Cell:
+    __slots__ = ("value", "ready")
     value: Q
-    ready: Signal = field(default_factory=Signal)
+    ready: Signal
 
 
 class Function(Elaboratable):
@@ -21,7 +24,9 @@ class Function(Elaboratable):
         self.args = [arg.value for arg in args]
         self.self_ready = Signal(reset=1)
         self.input_ready = Cat([self.self_ready, *[arg.ready for arg in args]]).any()
-        self.result = Cell(Q(self.args[0].nint, self.args[0].nfrac, self.args[0].signed))
+        self.result = Cell(Q(self.args[0].nint, self.args[0].nfrac, self.args[0].signed), Signal())
+        # high while the result is not final yet
+        self.busy = Signal()
 
     def flat_args(self):
         res = []
@@ -45,6 +50,7 @@ class Sum(Function):
         counter = Signal(range(len(args)))
         acc = self.result.value.like()
         with m.FSM() as fsm:
+            m.d.comb += self.busy.eq(self.input_ready | ~fsm.ongoing("IDLE"))
             with m.State("IDLE"):
                 m.d.sync += self.result.ready.eq(0)
                 m.d.sync += self.self_ready.eq(0)
@@ -68,10 +74,65 @@ class Sum(Function):
 
         return m
 
+class Iteration(Elaboratable):
+    """Iterate a group of circularly referencing cells.
+
+    ``cells`` are the registers of the group and ``results`` the compiled
+    formulas for them. References inside the group carry no ready, so the
+    iteration is (re)started by ``start`` or by a ready on ``results``, which
+    comes from outside the group. Every clock all cells take their new
+    value, until every change is below ``tolerance`` or ``max_iterations``
+    updates were done, at which point the cells assert ready. ``busy`` is
+    high until then and ``update`` whenever the cells load. As ``results``
+    are sampled every clock they have to be combinational.
+    """
+    def __init__(self, cells, results, max_iterations=100, tolerance=0.001, start=Const(0)):
+        if max_iterations < 1:
+            raise ValueError(f"max_iterations must be at least 1, not {max_iterations}")
+        self.cells = cells
+        self.results = results
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.start = start
+        self.running = Signal()
+        self.iteration = Signal(range(max_iterations+1))
+        self.converged = Signal()
+        self.busy = Signal()
+        self.update = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+        start = Cat(self.start, *(res.ready for res in self.results)).any()
+        load = [cell.value.eq(res.value) for cell, res in zip(self.cells, self.results)]
+        deltas = []
+        for cell, res in zip(self.cells, self.results):
+            tolerance = Q.from_float(self.tolerance, cell.value.nint, cell.value.nfrac, cell.value.signed)
+            deltas.append((abs(res.value - cell.value) < tolerance).signal)
+        m.d.comb += self.converged.eq(Cat(deltas).all())
+        m.d.comb += self.busy.eq(start | self.running)
+        # iteration counts the updates done so far
+        done = self.converged | (self.iteration >= self.max_iterations)
+        m.d.comb += self.update.eq(start | (self.running & ~done))
+
+        m.d.sync += [cell.ready.eq(0) for cell in self.cells]
+        with m.If(start):
+            m.d.sync += load
+            m.d.sync += self.iteration.eq(1)
+            m.d.sync += self.running.eq(1)
+        with m.Elif(self.running):
+            with m.If(done):
+                m.d.sync += self.running.eq(0)
+                m.d.sync += [cell.ready.eq(1) for cell in self.cells]
+            with m.Else():
+                m.d.sync += load
+                m.d.sync += self.iteration.eq(self.iteration+1)
+
+        return m
+
 if __name__ == '__main__':
     summer = Sum(
-        Cell(QArray([Q.from_float(2.0, 16, 0), Q.from_float(3.0, 16, 0)])),
-        Cell(QArray([Q.from_float(5.0, 16, 0), Q.from_float(4.0, 16, 0)])),
+        Cell(QArray([Q.from_float(2.0, 16, 0), Q.from_float(3.0, 16, 0)]), Const(0)),
+        Cell(QArray([Q.from_float(5.0, 16, 0), Q.from_float(4.0, 16, 0)]), Const(0)),
     )
     sim = Simulator(summer)
     def testbench():
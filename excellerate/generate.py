@@ -0,0 +1,88 @@
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+import random
+
+# Every generator returns (workbook, inputs, outputs) where inputs and
+# outputs are cell names that can be handed to simulation.Harness.
+
+def chain(size):
+    """A single column where every cell depends on the one above it."""
+    wb = Workbook()
+    ws = wb.active
+    ws["A1"] = 1
+    for row in range(2, size+1):
+        ws[f"A{row}"] = f"=A{row-1}+1"
+    return wb, ["A1"], [f"A{size}"]
+
+def fanin(size):
+    """A column of constants summed by one wide SUM."""
+    wb = Workbook()
+    ws = wb.active
+    for row in range(1, size+1):
+        ws[f"A{row}"] = row
+    ws["B1"] = f"=SUM(A1:A{size})"
+    return wb, ["A1"], ["B1"]
+
+def filldown(size, width=4):
+    """A formula row filled down, each column depending on the previous one."""
+    wb = Workbook()
+    ws = wb.active
+    for row in range(1, size+1):
+        ws[f"A{row}"] = row
+        for col in range(2, width+1):
+            prev = get_column_letter(col-1)
+            ws[f"{get_column_letter(col)}{row}"] = f"={prev}{row}*2-A{row}+$A$1"
+    last = get_column_letter(width)
+    return wb, ["A1"], [f"{last}1", f"{last}{size}"]
+
+def lookup(size, lookups=10):
+    """A key/value table with a column of INDEX lookups into it."""
+    wb = Workbook()
+    ws = wb.active
+    for row in range(1, size+1):
+        ws[f"A{row}"] = row
+        ws[f"B{row}"] = row*row
+    ws["C1"] = 1
+    lookups = min(lookups, size)
+    for row in range(1, lookups+1):
+        ws[f"D{row}"] = f"=INDEX(A1:B{size},C1,2)*A{row}"
+    return wb, ["C1"], ["D1", f"D{lookups}"]
+
+def sparse(size, density=0.01, seed=0):
+    """``size`` cells scattered over a grid, each referring to an earlier one."""
+    rng = random.Random(seed)
+    wb = Workbook()
+    ws = wb.active
+    side = max(1, int((size/density)**0.5))
+    cells = []
+    while len(cells) < size:
+        name = f"{get_column_letter(rng.randint(1, side))}{rng.randint(1, side)}"
+        if ws[name].value is not None:
+            continue
+        if cells:
+            ws[name] = f"={rng.choice(cells)}+1"
+        else:
+            ws[name] = 1
+        cells.append(name)
+    return wb, [cells[0]], [cells[-1]]
+
+SHAPES = {
+    "chain": chain,
+    "fanin": fanin,
+    "filldown": filldown,
+    "lookup": lookup,
+    "sparse": sparse,
+}
+
+def generate(shape, size, **kwargs):
+    if shape not in SHAPES:
+        raise NameError(f"shape {shape} not one of {', '.join(SHAPES)}")
+    return SHAPES[shape](size, **kwargs)
+
+if __name__ == '__main__':
+    import sys
+    shape, size, filename = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    wb, inputs, outputs = generate(shape, size)
+    wb.save(filename)
+    print("inputs:", *inputs)
+    print("outputs:", *outputs)
@@ -33,15 +33,18 @@ sign_t = test_token("OPERATOR-PREFIX", value={'+', '-'})
 
 @dataclass(frozen=True)
 class Function:
+    __slots__ = ("name", "args")
     name: str
     args: List[Any]
 
 @dataclass(frozen=True)
 class Array:
+    __slots__ = ("elements",)
     elements: List[Any]
 
 @dataclass(frozen=True)
 class Range:
+    __slots__ = ("sheet", "boundaries")
     sheet: str
     boundaries: Tuple[int, int, int, int]
 
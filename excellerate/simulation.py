@@ -0,0 +1,212 @@
+from nmigen import *
+from nmigen.sim.pysim import *
+from dataclasses import dataclass, field
+from typing import Dict, List
+from vcd import VCDWriter
+import inspect
+import time
+
+from fixedpoint import Q
+import parser
+from compiler import Spreadsheet
+from functions import Location, Iteration
+
+BACKENDS = ("auto", "cxxsim", "pysim")
+
+def location(name, sheet=None):
+    """Turn a cell name like ``Sheet!B3`` or ``B3`` into a Location."""
+    if isinstance(name, Location):
+        return name
+    ast = parser.parse(f"={name}")
+    if not isinstance(ast, parser.Range):
+        raise ValueError(f"{name} is not a cell reference")
+    min_col, min_row, max_col, max_row = ast.boundaries
+    if min_col!=max_col or min_row!=max_row:
+        raise ValueError(f"{name} is a range, not a single cell")
+    sheet = ast.sheet or sheet
+    if sheet is None:
+        raise ValueError(f"{name} has no sheet and no default sheet is given")
+    return Location(sheet, min_col, min_row)
+
+def cxxsim_available():
+    """Whether the installed nMigen has the compiled cxxsim engine."""
+    if "engine" not in inspect.signature(Simulator).parameters:
+        return False
+    try:
+        import nmigen.sim.cxxsim
+    except ImportError:
+        return False
+    return True
+
+def simulator(design, backend="auto"):
+    """Create a Simulator, using the compiled backend when it is available."""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend {backend} not one of {BACKENDS}")
+    if backend == "auto":
+        backend = "cxxsim" if cxxsim_available() else "pysim"
+    if backend == "pysim":
+        return Simulator(design), "pysim"
+    if not cxxsim_available():
+        raise ValueError("backend cxxsim is not provided by the installed nMigen")
+    return Simulator(design, engine="cxxsim"), "cxxsim"
+
+@dataclass
+class SimulationResult:
+    backend: str
+    samples: List[Dict[str, float]] = field(default_factory=list)
+    latency: List[int] = field(default_factory=list)
+    timeouts: List[List[str]] = field(default_factory=list)
+    cycles: int = 0
+    elapsed: float = 0.0
+    # only counted with count_activity
+    output_changes: int = 0
+    output_toggles: int = 0
+    loads: int = 0
+
+    @property
+    def cycles_per_second(self):
+        if self.elapsed == 0:
+            return float("inf")
+        return self.cycles/self.elapsed
+
+    @property
+    def output_changes_per_cycle(self):
+        return self.output_changes/max(self.cycles, 1)
+
+    @property
+    def output_toggles_per_cycle(self):
+        return self.output_toggles/max(self.cycles, 1)
+
+    @property
+    def loads_per_cycle(self):
+        return self.loads/max(self.cycles, 1)
+
+
+class Harness:
+    """Drive named input cells with stimulus vectors and sample named outputs.
+
+    Instead of ticking a fixed number of cycles and reading every cell, each
+    vector is applied by pulsing the ready signal of its input cells, after
+    which the harness only watches the ready signals of the requested outputs.
+    """
+
+    def __init__(self, workbook, inputs, outputs, backend="auto", sheet=None, **kwargs):
+        self.sheet = sheet = sheet or workbook.sheetnames[0]
+        self.inputs = {name: location(name, sheet) for name in inputs}
+        self.outputs = {name: location(name, sheet) for name in outputs}
+        self.backend = backend
+        if "circular" in kwargs:
+            kwargs["circular"] = [[location(name, sheet) for name in group]
+                                  for group in kwargs["circular"]]
+        self.spreadsheet = Spreadsheet(workbook, inputs=self.inputs.values(), **kwargs)
+
+    def run(self, vectors, max_cycles=1000, settle=4, vcd_file=None, traces=None, window=None,
+            count_activity=False):
+        """Apply ``vectors`` (dicts of input name to value) one after another.
+
+        For every vector the harness waits until each output has asserted
+        ready, no SUM or circular group is busy and no output has asserted
+        ready for ``settle`` cycles, or ``max_cycles`` have passed, and
+        records the last value. A ready only means an input changed, so an
+        output can take several values before the design is quiet. When
+        ``vcd_file`` is given only ``traces`` (by default the inputs and
+        outputs) are dumped, and only for cycles in ``window`` (start, stop).
+
+        ``count_activity`` reads every register output on every cycle, the
+        value and ready of each cell and the dirty flags, and counts the
+        ones that changed (output_changes) and their flipped bits
+        (output_toggles). It doesn't see the combinational logic in between.
+        ``loads`` are the cell registers loaded per the evaluation mode:
+        every formula cell on every clock when always evaluating, those that
+        asserted ready when evaluating on activity, plus circular groups in
+        both modes while they iterate. This is meant for comparing
+        evaluation modes and slows the simulation down.
+        """
+        cells = self.spreadsheet.cells
+        sim, backend = simulator(self.spreadsheet, self.backend)
+        result = SimulationResult(backend)
+        if traces is None:
+            traces = [*self.inputs, *self.outputs]
+        traced = {name: cells[location(name, self.sheet)] for name in traces}
+        start, stop = window or (0, None)
+        writer = None
+        if vcd_file is not None:
+            vcd = open(vcd_file, "w")
+            writer = VCDWriter(vcd, timescale="1 us")
+            variables = {name: writer.register_var("top", name.replace("!", "_"), "wire",
+                                                   size=len(cell.value))
+                         for name, cell in traced.items()}
+
+        spr = self.spreadsheet
+        registers = [sig for cell in cells.values() for sig in (cell.value.signal, cell.ready)]
+        registers += spr.dirty
+        groups = [sub for sub in spr.submodules if isinstance(sub, Iteration)]
+        previous = {}
+
+        def tick():
+            if count_activity:
+                # a group's update is what its registers load on this edge
+                yield Settle()
+                for group in groups:
+                    result.loads += len(group.cells)*(yield group.update)
+            yield Tick()
+            yield Settle()
+            result.cycles += 1
+            if count_activity:
+                for sig in registers:
+                    value = (yield sig) & ((1 << len(sig))-1)
+                    changed = previous.get(id(sig), 0) ^ value
+                    previous[id(sig)] = value
+                    result.output_changes += changed != 0
+                    result.output_toggles += bin(changed).count("1")
+                if spr.evaluation == "always":
+                    result.loads += len(spr.driven)
+                else:
+                    for loc in spr.driven:
+                        result.loads += (yield cells[loc].ready)
+            if writer is not None and start <= result.cycles and (stop is None or result.cycles < stop):
+                for name, cell in traced.items():
+                    value = yield cell.value.signal
+                    writer.change(variables[name], result.cycles, value & ((1 << len(cell.value))-1))
+
+        def testbench():
+            for vector in vectors:
+                inputs = [cells[self.inputs[name]] for name in vector]
+                for cell, value in zip(inputs, vector.values()):
+                    const = Q.from_float(value, cell.value.nint, cell.value.nfrac, cell.value.signed)
+                    yield cell.value.signal.eq(const.signal)
+                    yield cell.ready.eq(1)
+
+                began = last = quiet = result.cycles
+                pending = dict(self.outputs)
+                sample = {}
+                while ((pending or result.cycles - quiet < settle)
+                       and result.cycles - began < max_cycles):
+                    yield from tick()
+                    for cell in inputs:
+                        yield cell.ready.eq(0)
+                    inputs = []
+                    if (yield spr.busy):
+                        quiet = result.cycles
+                    for name, loc in self.outputs.items():
+                        if (yield cells[loc].ready):
+                            pending.pop(name, None)
+                            last = quiet = result.cycles
+                            sample[name] = cells[loc].value.to_float((yield cells[loc].value.signal))
+                for name, loc in pending.items():
+                    sample[name] = cells[loc].value.to_float((yield cells[loc].value.signal))
+                result.samples.append(sample)
+                result.latency.append(last - began)
+                result.timeouts.append(list(pending))
+
+        sim.add_clock(1e-6)
+        sim.add_process(testbench)
+        begin = time.perf_counter()
+        try:
+            sim.run()
+        finally:
+            result.elapsed = time.perf_counter() - begin
+            if writer is not None:
+                writer.close()
+                vcd.close()
+        return result
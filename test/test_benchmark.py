@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+from nmigen import Fragment
+
+# the compiler modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "excellerate"))
+from benchmark import *
+from functions import Location
+from generate import *
+
+class TestGenerate(unittest.TestCase):
+
+    def test_shapes_compile(self):
+        for shape in SHAPES:
+            with self.subTest(shape=shape):
+                wb, inputs, outputs = generate(shape, 6)
+                spr = Spreadsheet(wb)
+                Fragment.get(spr, None)
+                ws = wb.active
+                formulas = {Location(ws.title, cell.column, cell.row)
+                            for row in ws for cell in row if cell.data_type == 'f'}
+                self.assertTrue(formulas)
+                self.assertLessEqual(formulas, set(spr.driven))
+
+    def test_outputs_follow_inputs(self):
+        for shape in SHAPES:
+            with self.subTest(shape=shape):
+                wb, inputs, outputs = generate(shape, 6)
+                res = simulate(wb, inputs, outputs, vectors=2, max_cycles=100)
+                self.assertEqual(res.timeouts, [[], []])
+                self.assertNotEqual(res.samples[0], res.samples[1])
+
+    def test_lookup(self):
+        wb, inputs, outputs = lookup(6, lookups=3)
+        res = Harness(wb, inputs, outputs).run([{"C1": 2}, {"C1": 5}])
+        self.assertEqual(res.samples, [{"D1": 4.0, "D3": 12.0}, {"D1": 25.0, "D3": 75.0}])
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_measure(self):
+        m = measure("chain", 5, synth=False, repeat=2)
+        self.assertEqual(m.cells, 5)
+        self.assertIsNone(m.rss_per_10k_cells)
+        self.assertGreater(m.cycles_per_second, 0)
+        self.assertGreater(m.loads_per_cycle, 0)
+
+    def test_rss_worker_fails(self):
+        with self.assertRaisesRegex(RuntimeError, "shape nope"):
+            rss_per_10k_cells("nope", 5)
+
+    def test_compare(self):
+        previous = {"label": "old", "results": [
+            {"shape": "chain", "size": 5, "parse_time": 1.0,
+             "simulate_time": 1.0, "cycles_per_second": 100.0}]}
+        current = {"label": "new", "results": [
+            {"shape": "chain", "size": 5, "evaluation": "always", "parse_time": 1.05,
+             "simulate_time": 1.0, "cycles_per_second": 50.0}]}
+        self.assertEqual(compare(previous, current, 0.1), 1)
+
+    def test_compare_short(self):
+        previous = {"label": "old", "results": [
+            {"shape": "chain", "size": 5, "parse_time": 0.001, "elaborate_time": 1.0,
+             "simulate_time": 0.002, "cycles_per_second": 100.0, "peak_memory": 1000}]}
+        current = {"label": "new", "results": [
+            {"shape": "chain", "size": 5, "evaluation": "always", "parse_time": 0.002,
+             "elaborate_time": 1.5, "simulate_time": 1.0, "cycles_per_second": 50.0,
+             "peak_memory": 2000}]}
+        # only elaborate_time and peak_memory were measured long enough
+        self.assertEqual(compare(previous, current, 0.1), 2)
+
+    def test_compare_noise(self):
+        previous = {"label": "old", "results": [
+            {"shape": "chain", "size": 5, "parse_time": 1.0, "noise": 0.3}]}
+        current = {"label": "new", "results": [
+            {"shape": "chain", "size": 5, "evaluation": "always", "parse_time": 1.35,
+             "noise": 0.1}]}
+        self.assertEqual(compare(previous, current, 0.1), 0)
+        current["results"][0]["parse_time"] = 1.45
+        self.assertEqual(compare(previous, current, 0.1), 1)
+
+if __name__ == '__main__':
+    unittest.main()
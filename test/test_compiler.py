@@ -0,0 +1,142 @@
+import os
+import sys
+import unittest
+from openpyxl import Workbook
+
+# the compiler modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "excellerate"))
+from compiler import *
+from generate import generate
+from simulation import Harness, location
+
+def _circular():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sheet"
+    ws["A1"] = 3
+    ws["B1"] = "=A1+B2*0.5"
+    ws["B2"] = "=B1*0.5"
+    ws["C1"] = "=C1*0.5+1"
+    return wb
+
+class TestCircular(unittest.TestCase):
+
+    def test_constant_group(self):
+        harness = Harness(_circular(), [], ["B1", "B2", "C1"],
+                          circular=[["B1", "B2"], ["C1"]])
+        res = harness.run([{}], max_cycles=200)
+        self.assertEqual(res.timeouts, [[]])
+        self.assertAlmostEqual(res.samples[0]["B1"], 4.0, delta=0.01)
+        self.assertAlmostEqual(res.samples[0]["B2"], 2.0, delta=0.01)
+        self.assertAlmostEqual(res.samples[0]["C1"], 2.0, delta=0.01)
+
+    def test_restart(self):
+        harness = Harness(_circular(), ["A1"], ["B1", "B2"],
+                          circular=[["B1", "B2"]], tolerance=0.0001)
+        res = harness.run([{"A1": 3}, {"A1": -1.5}], max_cycles=200)
+        self.assertEqual(res.timeouts, [[], []])
+        self.assertAlmostEqual(res.samples[0]["B1"], 4.0, delta=0.001)
+        self.assertAlmostEqual(res.samples[1]["B1"], -2.0, delta=0.001)
+        self.assertAlmostEqual(res.samples[1]["B2"], -1.0, delta=0.001)
+
+    def test_max_iterations(self):
+        # C1 goes 1, 1.5, 1.75, ... towards 2
+        for iterations, value in [(1, 1.0), (2, 1.5), (3, 1.75)]:
+            with self.subTest(max_iterations=iterations):
+                harness = Harness(_circular(), [], ["C1"], circular=[["C1"]],
+                                  max_iterations=iterations)
+                res = harness.run([{}], max_cycles=50)
+                self.assertEqual(res.samples, [{"C1": value}])
+
+    def test_sum_in_group(self):
+        wb = _circular()
+        wb.active["B1"] = "=A1+SUM(B2:B3)*0.5"
+        self.assertRaises(ValueError, Fragment.get,
+                          Spreadsheet(wb, circular=[[location("B1", "Sheet"), location("B2", "Sheet")]]),
+                          None)
+
+    def test_invalid_iterations(self):
+        self.assertRaises(ValueError, Spreadsheet, _circular(), max_iterations=0)
+
+class TestIndex(unittest.TestCase):
+
+    def test_row(self):
+        wb = Workbook()
+        ws = wb.active
+        for col in "ABCDE":
+            ws[f"{col}1"] = "ABCDE".index(col)+1
+        ws["A2"] = 1
+        ws["B2"] = "=INDEX(A1:E1,A2)"
+        res = Harness(wb, ["A2"], ["B2"]).run([{"A2": 3}, {"A2": 5}])
+        self.assertEqual(res.samples, [{"B2": 3.0}, {"B2": 5.0}])
+
+    def test_single_cell(self):
+        wb = Workbook()
+        ws = wb.active
+        ws["A1"] = 1
+        ws["B1"] = "=INDEX(A1,1)"
+        self.assertRaises(TypeError, Fragment.get, Spreadsheet(wb), None)
+
+class TestActivity(unittest.TestCase):
+
+    def test_same_values(self):
+        for shape in ["chain", "fanin", "filldown", "lookup"]:
+            with self.subTest(shape=shape):
+                wb, inputs, outputs = generate(shape, 6)
+                vectors = [{name: 2 for name in inputs}, {name: 3 for name in inputs}]
+                always = Harness(wb, inputs, outputs).run(vectors, max_cycles=100)
+                activity = Harness(wb, inputs, outputs, evaluation="activity").run(vectors, max_cycles=100)
+                self.assertEqual(always.samples, activity.samples)
+                self.assertEqual(activity.timeouts, [[], []])
+
+    def test_count_activity(self):
+        for evaluation in ["always", "activity"]:
+            with self.subTest(evaluation=evaluation):
+                harness = Harness(_circular(), ["A1"], ["B1", "C1"], circular=[["B1", "B2"], ["C1"]],
+                                  max_iterations=3, evaluation=evaluation)
+                res = harness.run([{}], max_cycles=50, count_activity=True)
+                # C1 loads three times, B1 and B2 once as A1 is 0
+                self.assertEqual(res.loads, 5)
+                self.assertGreater(res.output_changes, 0)
+        wb, inputs, outputs = generate("chain", 6)
+        vectors = [{"A1": 2}]
+        always = Harness(wb, inputs, outputs).run(vectors, count_activity=True)
+        activity = Harness(wb, inputs, outputs, evaluation="activity").run(vectors, count_activity=True)
+        self.assertEqual(always.loads, 5*always.cycles)
+        self.assertLess(activity.loads, always.loads)
+
+    def test_sheet_enable(self):
+        wb, _, _ = generate("chain", 3)
+        sheet = wb.active.title
+        a1 = location("A1", sheet)
+        spr = Spreadsheet(wb, inputs=[a1], evaluation="activity", sheet_enable=True)
+        enable = spr.enable[sheet]
+        sim = Simulator(spr)
+        values = []
+        def testbench():
+            for _ in range(5):
+                yield Tick()
+            yield enable.eq(0)
+            yield spr.cells[a1].value.signal.eq(5 << spr.nfrac)
+            yield spr.cells[a1].ready.eq(1)
+            yield Tick()
+            yield spr.cells[a1].ready.eq(0)
+            for _ in range(5):
+                yield Tick()
+            yield Settle()
+            values.append((yield spr.cells[location("A3", sheet)].value.signal))
+            yield enable.eq(1)
+            for _ in range(5):
+                yield Tick()
+            yield Settle()
+            values.append((yield spr.cells[location("A3", sheet)].value.signal))
+        sim.add_clock(1e-6)
+        sim.add_process(testbench)
+        sim.run()
+        self.assertEqual([v >> spr.nfrac for v in values], [2, 7])
+
+    def test_sheet_enable_always(self):
+        self.assertRaises(ValueError, Spreadsheet, _circular(), sheet_enable=True)
+
+if __name__ == '__main__':
+    unittest.main()
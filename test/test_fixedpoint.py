@@ -24,6 +24,12 @@ class TestQ(unittest.TestCase):
         self.assertEqual(n.nfrac, m.nfrac)
         self.assertEqual(_resolve_fp(n), _resolve_fp(m))
 
+    def test_cast_cached(self):
+        n = Q.from_float(math.pi, 8, 16)
+        self.assertIs(n.cast(16, 32), n.cast(16, 32))
+        self.assertIsNot(n.cast(16, 32), n.cast(4, 4))
+        self.assertIs(n, Q.from_float(math.pi, 8, 16))
+
     def test_shrink(self):
         n = Q.from_float(math.pi, 4, 4)
         m = Q.from_float(math.pi, 8, 16).cast(4, 4)
@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import unittest
+import warnings
+from openpyxl import Workbook
+from nmigen.hdl.ir import DriverConflict
+
+# the compiler modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "excellerate"))
+from simulation import *
+
+def _workbook():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sheet"
+    ws["A1"] = 2
+    ws["A2"] = "=A1+1"
+    ws["B1"] = "=A2*2"
+    ws["B2"] = "=A2-A1*3"
+    ws["C1"] = 5
+    ws["C2"] = "=C1+1"
+    ws["D1"] = "=Z9"
+    return wb
+
+class TestLocation(unittest.TestCase):
+
+    def test_cell(self):
+        self.assertEqual(location("B3", "Sheet"), Location("Sheet", 2, 3))
+        self.assertEqual(location("Other!$B$3", "Sheet"), Location("Other", 2, 3))
+        self.assertEqual(location("'my sheet'!A1"), Location("my sheet", 1, 1))
+        loc = Location("Sheet", 1, 1)
+        self.assertIs(location(loc), loc)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, location, "A1:B2", "Sheet")
+        self.assertRaises(ValueError, location, "B3")
+        self.assertRaises(ValueError, location, "1", "Sheet")
+
+class TestHarness(unittest.TestCase):
+
+    def test_samples(self):
+        harness = Harness(_workbook(), ["A1"], ["A2", "B1", "B2"])
+        res = harness.run([{"A1": 2}, {"A1": -1.5}])
+        self.assertEqual(res.samples, [
+            {"A2": 3.0, "B1": 6.0, "B2": -3.0},
+            {"A2": -0.5, "B1": -1.0, "B2": 4.0},
+        ])
+        # B1 and B2 are two registers away from A1
+        self.assertEqual(res.latency, [2, 2])
+        self.assertEqual(res.timeouts, [[], []])
+        self.assertEqual(res.backend, "pysim" if not cxxsim_available() else "cxxsim")
+
+    def test_constant_output(self):
+        res = Harness(_workbook(), [], ["C2"]).run([{}], max_cycles=100)
+        self.assertEqual(res.samples, [{"C2": 6.0}])
+        self.assertEqual(res.timeouts, [[]])
+        self.assertLess(res.cycles, 10)
+
+    def test_timeout(self):
+        res = Harness(_workbook(), ["A1"], ["A2", "D1"]).run([{"A1": 1}], max_cycles=10)
+        self.assertEqual(res.samples, [{"A2": 2.0, "D1": 0.0}])
+        self.assertEqual(res.timeouts, [["D1"]])
+        self.assertEqual(res.cycles, 10)
+
+    def test_sum_latency(self):
+        wb = Workbook()
+        ws = wb.active
+        for row in range(1, 31):
+            ws[f"A{row}"] = row
+        # the direct reference makes B1 ready long before the SUM is done
+        ws["B1"] = "=SUM(A1:A30)+A1"
+        ws["C1"] = "=SUM(A2:A30)+1"
+        res = Harness(wb, ["A1"], ["B1"]).run([{"A1": v} for v in (1, 2, 3)])
+        self.assertEqual(res.timeouts, [[], [], []])
+        self.assertEqual(res.samples, [{"B1": 466.0}, {"B1": 468.0}, {"B1": 470.0}])
+        res = Harness(wb, [], ["C1"]).run([{}])
+        self.assertEqual(res.samples, [{"C1": 465.0}])
+
+    def test_run_twice(self):
+        harness = Harness(_workbook(), ["A1"], ["B2"], circular=[["C2"]])
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DriverConflict)
+            first = harness.run([{"A1": 2}], count_activity=True)
+            second = harness.run([{"A1": 2}], count_activity=True)
+        self.assertEqual(first.samples, second.samples)
+        self.assertEqual(first.loads_per_cycle, second.loads_per_cycle)
+        self.assertEqual(len(harness.spreadsheet.submodules), 1)
+
+    def test_vcd_window(self):
+        harness = Harness(_workbook(), ["A1"], ["B1"])
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "test.vcd")
+            harness.run([{"A1": 2}], vcd_file=filename, window=(2, 4))
+            with open(filename) as f:
+                vcd = f.read()
+        self.assertIn(" A1 ", vcd)
+        self.assertIn(" B1 ", vcd)
+        self.assertNotIn(" A2 ", vcd)
+        times = {int(line[1:]) for line in vcd.splitlines() if line.startswith("#")}
+        # values are only written when they change
+        self.assertIn(2, times)
+        self.assertLessEqual(times - {0}, {2, 3})
+
+    def test_backend(self):
+        spr = Harness(_workbook(), [], ["C2"]).spreadsheet
+        self.assertRaises(ValueError, simulator, spr, "verilator")
+        if not cxxsim_available():
+            self.assertRaises(ValueError, simulator, spr, "cxxsim")
+
+if __name__ == '__main__':
+    unittest.main()